@@ -143,23 +143,33 @@ function previewVideo(file) {
     }
 }
 
+async function hashVideo(video) {
+    // crypto.subtle is only available in secure contexts (https or localhost)
+    if (!window.crypto || !crypto.subtle) {
+        return null;
+    }
+    const digest = await crypto.subtle.digest('SHA-256', await video.arrayBuffer());
+    return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+}
+
 function processVideo() {
     const videoFile = document.getElementById('videoFile').files[0];
     const framesPerSecond = document.getElementById('framesPerSecond').value;
-    const formData = new FormData();
-
-    if (videoFile) {
-        formData.append('video', videoFile);
-    } else {
-        const blob = new Blob(recordedChunks, { type: 'video/mp4' });
-        formData.append('video', blob, 'screen-recording.mp4');
-    }
-
-    formData.append('frames_per_second', framesPerSecond);
+    const video = videoFile || new Blob(recordedChunks, { type: 'video/mp4' });
 
-    fetch('/process_video', {
-        method: 'POST',
-        body: formData
+    // Send the video as the raw request body so the server can stream it into ffmpeg. The content
+    // hash lets the server reuse the grids of a video it has already processed.
+    hashVideo(video)
+    .then(contentHash => {
+        const headers = { 'Content-Type': video.type.startsWith('video/') ? video.type : 'video/mp4' };
+        if (contentHash) {
+            headers['X-Content-SHA256'] = contentHash;
+        }
+        return fetch(`/process_video?frames_per_second=${encodeURIComponent(framesPerSecond)}`, {
+            method: 'POST',
+            headers: headers,
+            body: video
+        });
     })
     .then(response => response.json())
     .then(data => {
@@ -183,9 +193,14 @@ function displayProcessedFrames(frames) {
         const frameElement = document.createElement('div');
         frameElement.className = 'frame-item';
         frameElement.innerHTML = `
-            <img src="data:image/jpeg;base64,${frame.image}" alt="Frame ${frame.frame_number}" class="img-fluid">
+            <img src="${frame.url}" alt="Frame ${frame.frame_number}" class="img-fluid">
             <p class="mt-2">Frame ${frame.frame_number}</p>
+            <button class="btn btn-sm btn-outline-secondary">Describe</button>
+            <div class="frame-description mt-2"></div>
         `;
+        frameElement.querySelector('button').addEventListener('click', () => {
+            describeGrid(frame.frame_number, frameElement.querySelector('.frame-description'));
+        });
         gridContainer.appendChild(frameElement);
     });
 }
@@ -208,14 +223,13 @@ function generateDocumentation() {
         }
         return response.json();
     })
-    .then(data => {
-        if (data.error) {
-            throw new Error(data.error);
-        } else {
-            documentationOutput.innerHTML = marked.parse(data.documentation);
-            downloadButton.style.display = 'inline-block';
-            downloadButton.onclick = () => downloadMarkdown(data.documentation);
-        }
+    .then(data => streamText(data.stream_url, text => {
+        documentationOutput.innerHTML = marked.parse(text);
+    }, { resumable: true }))
+    .then(documentation => {
+        documentationOutput.innerHTML = marked.parse(documentation);
+        downloadButton.style.display = 'inline-block';
+        downloadButton.onclick = () => downloadMarkdown(documentation);
     })
     .catch(error => {
         console.error('Error:', error);
@@ -223,6 +237,52 @@ function generateDocumentation() {
     });
 }
 
+function describeGrid(gridNumber, output) {
+    output.innerHTML = 'Describing grid...';
+    streamText(`/stream_grid/${gridNumber}`, text => {
+        output.innerHTML = marked.parse(text);
+    })
+    .then(description => {
+        output.innerHTML = marked.parse(description);
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        output.innerHTML = `An error occurred while describing the grid: ${error.message}`;
+    });
+}
+
+function streamText(streamUrl, onProgress, { resumable = false } = {}) {
+    // Generated text is streamed as server-sent events while it is written. Resumable streams
+    // (/stream/<job_id>) pick up after the last received chunk when EventSource reconnects; for
+    // the others a reconnect would start the generation over, so a dropped connection ends them.
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(streamUrl);
+        let text = '';
+
+        source.onmessage = event => {
+            text += JSON.parse(event.data);
+            onProgress(text);
+        };
+        source.addEventListener('done', event => {
+            source.close();
+            resolve(JSON.parse(event.data));
+        });
+        source.addEventListener('failed', event => {
+            source.close();
+            reject(new Error(JSON.parse(event.data)));
+        });
+        source.onerror = () => {
+            if (!resumable) {
+                source.close();
+            }
+            // EventSource reconnects on its own unless the connection was refused outright
+            if (source.readyState === EventSource.CLOSED) {
+                reject(new Error('Lost connection to the documentation stream'));
+            }
+        };
+    });
+}
+
 function downloadMarkdown(content) {
     const blob = new Blob([content], { type: 'text/markdown' });
     const url = URL.createObjectURL(blob);
@@ -6,16 +6,40 @@ vision-language model from HuggingFace or the OpenAI Vision model. It supports b
 inference and API-based generation.
 """
 
-from transformers import MllamaForConditionalGeneration, AutoProcessor
+from transformers import (
+    MllamaForConditionalGeneration,
+    AutoProcessor,
+    BitsAndBytesConfig,
+    FbgemmFp8Config,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+    BatchFeature,
+    DynamicCache,
+)
+from transformers.models.mllama.processing_mllama import (
+    get_cross_attention_token_mask,
+    convert_sparse_cross_attention_mask_to_dense,
+)
 import torch
 from PIL import Image
 import logging
 import time
 import os
 import base64
+import asyncio
+import contextlib
+import functools
+import importlib.util
+from collections import OrderedDict
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+import httpx
+import xxhash
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from turbojpeg import TurboJPEG, TJPF_RGB
 import io  # Added import for BytesIO
 
 # Set up logging
@@ -25,6 +49,19 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# libjpeg-turbo decoder, several times faster than PIL's JPEG decoding
+jpeg = TurboJPEG()
+
+class StopOnEvent(StoppingCriteria):
+    """Stop generating once a threading.Event is set, e.g. when a streaming client disconnects."""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
 class DocsGenerator:
     """
     A class for generating documentation from images using either a local vision-language model
@@ -34,16 +71,75 @@ class DocsGenerator:
     documentation for given images.
     """
 
-    def __init__(self, model_type='huggingface', model_path=None):
+    # OpenAI clients keyed on API key, shared across instances
+    _openai_clients = {}
+
+    # Upper bound on generated tokens; typical responses finish well before this
+    MAX_NEW_TOKENS = 600
+
+    # Placeholder for the grid index when tokenizing the prompt template
+    GRID_SENTINEL = "<GRID>"
+
+    # Number of grids whose preprocessed pixel values are kept (about 7.5 MB each in bf16)
+    FEATURE_CACHE_SIZE = 64
+
+    # Per-grid prompt, filled in with str.format(grid_index=...)
+    PROMPT_TEMPLATE = """
+        This is grid {grid_index} of a series of 2x2 grids of screenshots from a screen recording, numbered in order. 
+        Analyze these four frames and provide a detailed commentary on the process or workflow shown. 
+        Describe what's happening in each frame, noting any significant changes or actions between frames.
+
+        The global objective is to analyze multiple 2x2 grids like these to build a coherent picture of a bigger process. 
+        You do not always have complete frames of the whole process, so be sure to only explain what you can see objectively.
+        
+        ####
+        Example:
+
+        Frame 1: User is on a webpage with a search bar and a submit button.
+        Frame 2: User has entered "Hello" in the search bar.
+        Frame 3: The submit button is clicked.
+        Frame 4: The webpage displays a search results page with a list of links.
+        ####
+        
+        ####
+        Commentary:
+        The user is performing a web search.
+        They start on a search page, enter their query, submit the search, and then view the results.
+        This grid captures the entire search process from start to finish.
+        
+        ####
+        Now, analyze the following 2x2 grid:
+        """
+
+    # HTTP settings for the OpenAI clients. HTTP/2 multiplexes concurrent grid requests over a few
+    # long-lived TLS connections instead of opening one per request.
+    OPENAI_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    OPENAI_TIMEOUT = httpx.Timeout(60.0)
+    OPENAI_MAX_RETRIES = 2
+
+    def __init__(self, model_type='huggingface', model_path=None, compile_model=True, quantization='none'):
         """
         Initialize the DocsGenerator with either a local model or OpenAI API setup.
 
         Args:
             model_type (str): Either 'huggingface' or 'openai'.
             model_path (str): Path to the pre-trained model weights (for HuggingFace model only).
+            compile_model (bool): Whether to compile the model forward pass with torch.compile
+                (HuggingFace model on CUDA only). Disable if compilation fails on your setup.
+            quantization (str): Weight quantization for the HuggingFace model: 'none', 'int4'
+                (bitsandbytes NF4) or 'fp8' (FP8 E4M3 via fbgemm). Quantization requires CUDA.
         """
         logger.info(f"Initializing DocsGenerator with model type: {model_type}")
         self.model_type = model_type
+        self.compile_model = compile_model
+        if quantization not in ('none', 'int4', 'fp8'):
+            raise ValueError("Invalid quantization. Choose 'none', 'int4' or 'fp8'.")
+        self.quantization = quantization
+        # Serializes generate() calls; the job worker and streaming requests share one model
+        self._generate_lock = threading.Lock()
+        # Templated prompts by grid index. The cache is per instance: a class-level lru_cache would
+        # hold a reference to every instance, and its model, for as long as its entries remain.
+        self._create_chat_text = functools.lru_cache(maxsize=256)(self._create_chat_text)
 
         if model_type == 'huggingface':
             self._init_huggingface_model(model_path)
@@ -57,42 +153,172 @@ class DocsGenerator:
         logger.info(f"Initializing DocsGenerator with model path: {model_path}")
         start_time = time.time()
 
-        # Ensure MPS is available and set it as the default device
-        assert torch.backends.mps.is_available(), "MPS should be available on M2 Mac"
-        device = torch.device("mps")
-        logger.info("Using MPS (Metal Performance Shaders) for acceleration")
+        if torch.cuda.is_available():
+            device = torch.device("cuda")
+            # bfloat16 avoids the fp16 overflow issues seen with compiled kernels
+            torch_dtype = torch.bfloat16
+            logger.info("Using CUDA for acceleration")
+        else:
+            # Ensure MPS is available and set it as the default device
+            assert torch.backends.mps.is_available(), "MPS should be available on M2 Mac"
+            device = torch.device("mps")
+            torch_dtype = torch.float16  # Use float16 for optimal performance
+            # Lift the allocator's high watermark so the 11B model isn't refused memory on unified RAM
+            torch.mps.set_per_process_memory_fraction(0.0)
+            logger.info("Using MPS (Metal Performance Shaders) for acceleration")
+
+        # Allow reduced-precision (TF32 / bf16) kernels for any remaining float32 matmuls
+        torch.set_float32_matmul_precision('medium')
+
+        if self.quantization != 'none' and device.type != "cuda":
+            raise ValueError(f"Quantization '{self.quantization}' requires a CUDA device")
+        if self.quantization == 'fp8':
+            # fbgemm's FP8 kernels run on Hopper (sm_90) and newer GPUs only
+            if importlib.util.find_spec("fbgemm_gpu") is None:
+                raise ValueError("Quantization 'fp8' requires the fbgemm-gpu package")
+            if torch.cuda.get_device_capability(device) < (9, 0):
+                raise ValueError("Quantization 'fp8' requires a GPU with compute capability 9.0 (sm_90) or newer")
+
+        quantization_config = None
+        if self.quantization == 'int4':
+            # Decoding is memory-bandwidth bound, so 4-bit weights move ~4x fewer bytes per token
+            quantization_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.bfloat16,
+                bnb_4bit_quant_type="nf4",
+            )
+        elif self.quantization == 'fp8':
+            quantization_config = FbgemmFp8Config()
+
+        if self.compile_model:
+            # Persist compiled kernels so restarts reuse them instead of recompiling
+            root_dir = os.path.dirname(os.path.abspath(__file__))
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(root_dir, ".inductor_cache"))
+            os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
 
         # Load the model with optimizations
         self.model = MllamaForConditionalGeneration.from_pretrained(
             model_path,
-            torch_dtype=torch.float16,  # Use float16 for optimal performance
+            torch_dtype=torch_dtype,
             # low_cpu_mem_usage=True,
-            max_memory={0: "50GB"},
-        ).to(device)
+            # Quantized weights can't be moved with .to(), so place the model at load time
+            device_map={"": device},
+            quantization_config=quantization_config,
+            # Fused attention kernels never materialize the full attention score matrix
+            attn_implementation="sdpa",
+        )
+        logger.info(f"Attention implementation: {self.model.config._attn_implementation}")
+
+        # Catch silent CPU offload, which would push every forward pass across the memory bus
+        offloaded = [name for name, param in self.model.named_parameters() if param.device.type != device.type]
+        if offloaded:
+            logger.warning(f"{len(offloaded)} parameters are not on {device.type}, e.g. {offloaded[0]}")
 
         # Load the processor
         self.processor = AutoProcessor.from_pretrained(model_path)
+        # Decoder-only generation needs left padding so batched prompts end at the same position
+        self.processor.tokenizer.padding_side = "left"
+        # Side of one vision tile
+        self._vision_size = self.processor.image_processor.size["height"]
+        # Image processor outputs of recent grids, keyed by content hash
+        self._feature_cache = OrderedDict()
+        self._feature_cache_lock = threading.Lock()
+
+        # Make sure generate() stops at end-of-turn instead of running to MAX_NEW_TOKENS
+        tokenizer = self.processor.tokenizer
+        generation_config = self.model.generation_config
+        eos_token_ids = generation_config.eos_token_id
+        if eos_token_ids is None:
+            eos_token_ids = []
+        elif not isinstance(eos_token_ids, list):
+            eos_token_ids = [eos_token_ids]
+        for token_id in (tokenizer.eos_token_id, tokenizer.convert_tokens_to_ids("<|eot_id|>")):
+            if token_id is not None and token_id not in eos_token_ids:
+                eos_token_ids.append(token_id)
+        generation_config.eos_token_id = eos_token_ids
+        if generation_config.pad_token_id is None:
+            generation_config.pad_token_id = tokenizer.pad_token_id
+
+        # Tokenize the prompt once; per request only the grid index tokens are spliced in
+        self._prompt_ids = self._tokenize_prompt_template()
 
         # Optimize the model for inference
         self.model.eval()
 
+        # Host-to-device copies go through reusable pinned buffers on a side stream
+        self._pinned_buffers = {}
+        self._copy_lock = threading.Lock()
+        self._copy_stream = torch.cuda.Stream() if device.type == "cuda" else None
+        self._copy_done = None
+
+        if self.compile_model and device.type == "cuda":
+            # Mllama only supports a DynamicCache, so the KV cache grows by one position at every
+            # decoding step. Compile with dynamic shapes so prefill and decoding each reuse one graph
+            # across sequence lengths, instead of recompiling per step. CUDA graphs need static shapes
+            # and are left off. fullgraph=False because the vision cross-attention layers contain
+            # graph breaks.
+            logger.info("Compiling model forward pass with torch.compile")
+            # Log recompiles so shapes that slip past the dynamic graphs show up in the logs
+            torch._logging.set_logs(recompiles=True)
+            self.model.forward = torch.compile(self.model.forward, fullgraph=False, dynamic=True)
+            self._warm_up()
+        elif self.compile_model:
+            logger.info(f"Skipping torch.compile: not supported on {device.type}")
+
         end_time = time.time()
         logger.info(f"Model and processor loaded successfully in {end_time - start_time:.2f} seconds")
 
+    def _warm_up(self):
+        """
+        Run a short generation so the first real request doesn't pay the compilation cost.
+
+        The dummy input goes through the same preprocessing as real grids: the image processor
+        always pads pixel_values to (batch, 1, max_image_tiles, 3, 560, 560), and the prompt is a
+        real grid prompt. A few new tokens compile both the prefill graph and the decoding graph,
+        whose cache length is dynamic. Batches of more than one grid compile once more on first use.
+        """
+        logger.info("Warming up compiled model")
+        start_time = time.time()
+        dummy_image = Image.new("RGB", (self._vision_size, self._vision_size))
+        inputs = self._prepare_huggingface_inputs(dummy_image, 1)
+        with self._generation_context():
+            self.model.generate(**inputs, max_new_tokens=4)
+        logger.info(f"Warm-up completed in {time.time() - start_time:.2f} seconds")
+
     def _init_openai_api(self):
         """Initialize the OpenAI API setup."""
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         if not self.openai_api_key:
             raise ValueError("OpenAI API key not found in .env file")
-        self.client = OpenAI(api_key=self.openai_api_key)
+        if self.openai_api_key not in DocsGenerator._openai_clients:
+            DocsGenerator._openai_clients[self.openai_api_key] = OpenAI(
+                api_key=self.openai_api_key,
+                http_client=httpx.Client(http2=True, limits=self.OPENAI_HTTP_LIMITS, timeout=self.OPENAI_TIMEOUT),
+                max_retries=self.OPENAI_MAX_RETRIES,
+            )
+        self.client = DocsGenerator._openai_clients[self.openai_api_key]
         logger.info("OpenAI API setup initialized successfully")
 
+    def _create_async_client(self):
+        """
+        Create an AsyncOpenAI client for concurrent requests.
+
+        The async client's connection pool is bound to the event loop it was first used on, so a
+        new client is created for each batch rather than shared across asyncio.run() calls.
+        """
+        return AsyncOpenAI(
+            api_key=self.openai_api_key,
+            http_client=httpx.AsyncClient(http2=True, limits=self.OPENAI_HTTP_LIMITS, timeout=self.OPENAI_TIMEOUT),
+            max_retries=self.OPENAI_MAX_RETRIES,
+        )
+
     def generate_documentation(self, image_data, grid_index):
         """
         Generate documentation for a given image.
 
         Args:
-            image_data (bytes): The image data as bytes.
+            image_data (str, bytes or PIL.Image.Image): Path to a JPEG file, JPEG data as bytes,
+                or a decoded image.
             grid_index (int): Index of the current grid in the series.
 
         Returns:
@@ -101,39 +327,42 @@ class DocsGenerator:
         logger.info(f"Generating documentation for grid {grid_index}")
         start_time = time.time()
 
-        image = Image.open(io.BytesIO(image_data))
-
         if self.model_type == 'huggingface':
-            documentation = self._generate_huggingface(image, grid_index)
+            documentation = self._generate_huggingface(image_data, grid_index)
         else:  # OpenAI
-            documentation = self._generate_openai(image, grid_index)
+            documentation = self._generate_openai(image_data, grid_index)
 
         end_time = time.time()
         logger.info(f"Total analysis time for grid {grid_index}: {end_time - start_time:.2f} seconds")
 
         return documentation
 
-    def _generate_huggingface(self, image, grid_index):
-        """Generate documentation using the HuggingFace model."""
-        logger.info(f"Attempting to open image at path: {image}")
-        logger.info(f"Image opened successfully. Size: {image.size}, Mode: {image.mode}")
+    def generate_documentation_stream(self, image_data, grid_index):
+        """
+        Generate documentation for a given image, yielding the text in chunks as it is generated.
 
-        prompt = self._create_prompt(grid_index)
+        Args:
+            image_data (str, bytes or PIL.Image.Image): Path to a JPEG file, JPEG data as bytes,
+                or a decoded image.
+            grid_index (int): Index of the current grid in the series.
 
-        messages = [
-            {"role": "user", "content": [
-                {"type": "image"},
-                {"type": "text", "text": prompt}
-            ]}
-        ]
+        Yields:
+            str: Successive chunks of the generated documentation.
+        """
+        logger.info(f"Streaming documentation for grid {grid_index}")
+        if self.model_type == 'huggingface':
+            yield from self._stream_huggingface(image_data, grid_index)
+        else:  # OpenAI
+            yield from self._stream_openai(image_data, grid_index)
 
+    def _generate_huggingface(self, image, grid_index):
+        """Generate documentation using the HuggingFace model."""
         logger.info("Preparing input for the model")
-        input_text = self.processor.apply_chat_template(messages, add_generation_prompt=True)
-        inputs = self.processor(images=image, text=input_text, return_tensors="pt").to(self.model.device)
+        inputs = self._prepare_huggingface_inputs(image, grid_index)
         logger.info(f"Inputs prepared successfully. Shape: {inputs['input_ids'].shape}")
 
         logger.info("Generating output from the model")
-        output = self.model.generate(**inputs, max_new_tokens=2000)
+        output = self._generate(inputs)
         logger.info(f"\n---\nOutput: {output}\n---\n")
         logger.info(f"Model output generated successfully. Shape: {output.shape}")
 
@@ -145,38 +374,378 @@ class DocsGenerator:
 
         return processed_documentation
 
+    def _load_image(self, image, as_bytes=False):
+        """
+        Load an image given as a file path, JPEG bytes or a PIL image.
+
+        Args:
+            image (str, bytes or PIL.Image.Image): The image to load.
+            as_bytes (bool): Return JPEG bytes instead of a decoded image. Paths and bytes are then
+                passed through without decoding; only PIL images are encoded.
+
+        Returns:
+            PIL.Image.Image or bytes: An RGB image, or JPEG data if `as_bytes` is set.
+        """
+        if isinstance(image, str):
+            with open(image, 'rb') as f:
+                image = f.read()
+
+        if isinstance(image, bytes):
+            if as_bytes:
+                return image
+            # libjpeg-turbo decodes straight to RGB and releases the GIL while doing so
+            return Image.fromarray(jpeg.decode(image, pixel_format=TJPF_RGB))
+
+        if as_bytes:
+            buffered = io.BytesIO()
+            image.convert("RGB").save(buffered, format="JPEG")
+            return buffered.getvalue()
+        return image
+
+    def _generate(self, inputs, cancel_event=None, **generate_kwargs):
+        """
+        Run model.generate() with the shared stopping rules.
+
+        Args:
+            inputs (BatchFeature): Model inputs on the model's device.
+            cancel_event (threading.Event): If given, generation stops once the event is set.
+            **generate_kwargs: Extra keyword arguments for model.generate().
+
+        Returns:
+            torch.Tensor: The generated token ids, including the prompt.
+        """
+        # End of turn is handled by the EOS tokens set up at load time
+        stopping_criteria = StoppingCriteriaList()
+        if cancel_event is not None:
+            stopping_criteria.append(StopOnEvent(cancel_event))
+
+        with self._generation_context():
+            return self.model.generate(
+                **inputs,
+                max_new_tokens=self.MAX_NEW_TOKENS,
+                stopping_criteria=stopping_criteria,
+                past_key_values=DynamicCache(),
+                **generate_kwargs,
+            )
+
+    def _stream_huggingface(self, image, grid_index):
+        """
+        Generate documentation with the HuggingFace model, yielding text as it is produced.
+
+        Generation runs in a background thread. Closing the generator (e.g. when the client
+        disconnects) stops generation at the next decoding step.
+        """
+        inputs = self._prepare_huggingface_inputs(image, grid_index)
+        streamer = TextIteratorStreamer(self.processor.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        cancel_event = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                self._generate(inputs, cancel_event=cancel_event, streamer=streamer)
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer; generate() only ends the streamer on success
+                streamer.end()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        try:
+            for text in streamer:
+                yield text
+        finally:
+            cancel_event.set()
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+    def _prepare_huggingface_inputs(self, image, grid_index):
+        """
+        Build the chat prompt for a grid and turn it into model inputs on the model's device.
+
+        Args:
+            image (str, bytes or PIL.Image.Image): The grid image.
+            grid_index (int): Index of the current grid in the series.
+
+        Returns:
+            BatchFeature: Processor outputs moved to the model's device.
+        """
+        return self._to_device(self._build_inputs([self._image_features(image)], [grid_index]))
+
+    def _tokenize_prompt_template(self):
+        """
+        Tokenize the chat prompt once, split around the grid index.
+
+        Returns:
+            tuple: (prefix_ids, suffix_ids), or None if splicing the grid index tokens between them
+                doesn't reproduce the processor's own tokenization.
+        """
+        tokenizer = self.processor.tokenizer
+        prefix, suffix = self._create_chat_text(self.GRID_SENTINEL).split(self.GRID_SENTINEL)
+        prompt_ids = (
+            tokenizer(prefix)["input_ids"],
+            tokenizer(suffix, add_special_tokens=False)["input_ids"],
+        )
+
+        # Token merges across the split points would change the ids; check against the processor
+        expected = self.processor(images=Image.new("RGB", (self._vision_size, self._vision_size)), text=self._create_chat_text(1))["input_ids"][0]
+        spliced = prompt_ids[0] + tokenizer("1", add_special_tokens=False)["input_ids"] + prompt_ids[1]
+        if list(expected) != spliced:
+            logger.warning("Prompt tokens can't be spliced around the grid index; tokenizing each prompt in full")
+            return None
+        return prompt_ids
+
+    def _prompt_input_ids(self, grid_index):
+        """Return the token ids of the chat prompt for the given grid index."""
+        tokenizer = self.processor.tokenizer
+        if self._prompt_ids is None:
+            return tokenizer(self._create_chat_text(grid_index))["input_ids"]
+        prefix_ids, suffix_ids = self._prompt_ids
+        return prefix_ids + tokenizer(str(grid_index), add_special_tokens=False)["input_ids"] + suffix_ids
+
+    def _build_inputs(self, image_features, grid_indices):
+        """
+        Build model inputs for a batch of grid images, equivalent to calling the processor with the
+        templated prompts but reusing the cached prompt tokens and image features.
+
+        Args:
+            image_features (list): Image processor outputs for each grid, from _image_features.
+            grid_indices (list): Grid index for each image.
+
+        Returns:
+            BatchFeature: Model inputs as CPU tensors.
+        """
+        tokenizer = self.processor.tokenizer
+        image_processor = self.processor.image_processor
+
+        encoding = tokenizer.pad({"input_ids": [self._prompt_input_ids(idx) for idx in grid_indices]}, padding=True)
+        num_tiles = [tiles for features in image_features for tiles in features["num_tiles"]]
+
+        cross_attention_token_mask = [
+            get_cross_attention_token_mask(input_ids, self.processor.image_token_id)
+            for input_ids in encoding["input_ids"]
+        ]
+        cross_attention_mask = convert_sparse_cross_attention_mask_to_dense(
+            cross_attention_token_mask,
+            num_tiles=num_tiles,
+            max_num_tiles=image_processor.max_image_tiles,
+            length=len(encoding["input_ids"][0]),
+        )
+
+        data = {**encoding, "cross_attention_mask": cross_attention_mask}
+        # Every grid is one image padded to max_image_tiles, so the features stack along the batch
+        for name in ("pixel_values", "aspect_ratio_ids", "aspect_ratio_mask"):
+            data[name] = torch.cat([features[name] for features in image_features])
+        return BatchFeature(data=data, tensor_type="pt")
+
+    def _image_features(self, image):
+        """
+        Run the image processor on a grid, reusing the result for grids seen recently.
+
+        Grids are keyed by a hash of their JPEG data (or pixels, for PIL images), so a cache hit
+        skips decoding, resizing and normalizing the image. The vision encoder itself still runs
+        on every request; generate() only accepts raw pixel values for Mllama.
+
+        Args:
+            image (str, bytes or PIL.Image.Image): The grid image.
+
+        Returns:
+            dict: pixel_values, aspect_ratio_ids and aspect_ratio_mask as tensors for a batch of
+                one, and num_tiles.
+        """
+        if isinstance(image, str):
+            image = self._load_image(image, as_bytes=True)
+        hasher = xxhash.xxh3_64()
+        if isinstance(image, bytes):
+            hasher.update(image)
+        else:
+            hasher.update(f"{image.mode}{image.size}".encode())
+            hasher.update(image.tobytes())
+        key = hasher.digest()
+
+        with self._feature_cache_lock:
+            features = self._feature_cache.get(key)
+            if features is not None:
+                self._feature_cache.move_to_end(key)
+                return features
+
+        features = self.processor.image_processor(
+            [[self._load_image(image)]], return_tensors="pt"
+        )
+        features = {
+            # Stored in the model's dtype, which halves both the cache footprint and the copy to the GPU
+            "pixel_values": features["pixel_values"].to(self.model.dtype),
+            "aspect_ratio_ids": features["aspect_ratio_ids"],
+            "aspect_ratio_mask": features["aspect_ratio_mask"],
+            "num_tiles": features["num_tiles"],
+        }
+
+        with self._feature_cache_lock:
+            self._feature_cache[key] = features
+            while len(self._feature_cache) > self.FEATURE_CACHE_SIZE:
+                self._feature_cache.popitem(last=False)
+        return features
+
+    def _to_device(self, inputs):
+        """
+        Move processor outputs to the model's device.
+
+        On CUDA the tensors are staged in reusable pinned host buffers and copied asynchronously on a
+        dedicated stream, so the transfer doesn't block the stream running generation.
+
+        Args:
+            inputs (BatchFeature): Processor outputs on the CPU.
+
+        Returns:
+            BatchFeature: The same outputs on the model's device.
+        """
+        device = self.model.device
+        if self._copy_stream is None:
+            return inputs.to(device)
+
+        with self._copy_lock:
+            # The previous copy may still be reading from the pinned buffers
+            if self._copy_done is not None:
+                self._copy_done.synchronize()
+
+            with torch.cuda.stream(self._copy_stream):
+                for key, tensor in inputs.items():
+                    buffer = self._pinned_buffers.get(key)
+                    if buffer is None or buffer.shape != tensor.shape or buffer.dtype != tensor.dtype:
+                        buffer = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+                        self._pinned_buffers[key] = buffer
+                    buffer.copy_(tensor)
+                    inputs[key] = buffer.to(device, non_blocking=True)
+                self._copy_done = torch.cuda.Event()
+                self._copy_done.record(self._copy_stream)
+
+        # Make the compute stream wait for the copies, and tell the allocator the tensors are used there
+        compute_stream = torch.cuda.current_stream(device)
+        compute_stream.wait_stream(self._copy_stream)
+        for tensor in inputs.values():
+            tensor.record_stream(compute_stream)
+        return inputs
+
+    def _create_chat_text(self, grid_index):
+        """
+        Apply the processor's chat template to the prompt for the given grid index.
+
+        Args:
+            grid_index (int): Index of the current grid in the series.
+
+        Returns:
+            str: The templated model input text, including the image placeholder.
+        """
+        prompt = self._create_prompt(grid_index)
+
+        messages = [
+            {"role": "user", "content": [
+                {"type": "image"},
+                {"type": "text", "text": prompt}
+            ]}
+        ]
+
+        return self.processor.apply_chat_template(messages, add_generation_prompt=True)
+
+    def _generation_context(self):
+        """
+        Context for running generate(): exclusive use of the model and no autograd bookkeeping.
+        SDPA already prefers the fused (flash / memory-efficient) kernels on CUDA and falls back
+        to the math kernel for inputs they don't support.
+        """
+        stack = contextlib.ExitStack()
+        stack.enter_context(self._generate_lock)
+        stack.enter_context(torch.inference_mode())
+        return stack
+
     def _generate_openai(self, image, grid_index):
         """Generate documentation using the OpenAI Vision API."""
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG")
-        base64_image = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        return "".join(self._stream_openai(image, grid_index))
 
+    def _stream_openai(self, image, grid_index):
+        """Generate documentation using the OpenAI Vision API, yielding text chunks as they arrive."""
+        base64_image = self._encode_image(image)
         prompt = self._create_prompt(grid_index)
 
         response = self.client.chat.completions.create(
             model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
+            messages=self._create_openai_messages(prompt, base64_image),
+            max_tokens=1000,
+            stream=True
+        )
+
+        yield from self._iter_openai_stream(response)
+
+    def _iter_openai_stream(self, response):
+        """Yield the text content of a streamed chat completion, skipping empty deltas."""
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def _generate_openai_async(self, client, image_data, grid_index):
+        """Generate documentation for one grid using an AsyncOpenAI client."""
+        # Reading and base64-encoding are blocking work; run them off the event loop so they
+        # overlap with the other in-flight requests
+        loop = asyncio.get_running_loop()
+        base64_image = await loop.run_in_executor(None, self._encode_image, image_data)
+        prompt = self._create_prompt(grid_index)
+
+        response = await client.chat.completions.create(
+            model="gpt-4o",
+            messages=self._create_openai_messages(prompt, base64_image),
             max_tokens=1000
         )
 
+        logger.info(f"Documentation generated for grid {grid_index}")
         return response.choices[0].message.content
 
+    async def _generate_openai_batch(self, images, grid_indices, concurrency):
+        """Run the OpenAI requests for a batch concurrently, at most `concurrency` at a time."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async with self._create_async_client() as client:
+            async def generate(image_data, grid_index):
+                async with semaphore:
+                    return await self._generate_openai_async(client, image_data, grid_index)
+
+            return await asyncio.gather(
+                *[generate(image_data, grid_index) for image_data, grid_index in zip(images, grid_indices)]
+            )
+
+    def _encode_image(self, image):
+        """
+        Encode an image as a base64 JPEG string.
+
+        Args:
+            image (str, bytes or PIL.Image.Image): Path to a JPEG file, JPEG data as bytes, or a
+                decoded image. JPEG input is encoded as-is without a decode/re-encode round trip.
+
+        Returns:
+            str: The base64-encoded JPEG.
+        """
+        return base64.b64encode(self._load_image(image, as_bytes=True)).decode('utf-8')
+
+    def _create_openai_messages(self, prompt, base64_image):
+        """Build the chat messages for an OpenAI Vision request."""
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        }
+                    }
+                ]
+            }
+        ]
+
     def _create_prompt(self, grid_index):
         """
         Create a prompt for the given grid index.
@@ -187,32 +756,7 @@ class DocsGenerator:
         Returns:
             str: The generated prompt.
         """
-        return f"""
-        This is grid {grid_index} of a series of 2x2 grids of screenshots from a screen recording, numbered in order. 
-        Analyze these four frames and provide a detailed commentary on the process or workflow shown. 
-        Describe what's happening in each frame, noting any significant changes or actions between frames.
-
-        The global objective is to analyze multiple 2x2 grids like these to build a coherent picture of a bigger process. 
-        You do not always have complete frames of the whole process, so be sure to only explain what you can see objectively.
-        
-        ####
-        Example:
-
-        Frame 1: User is on a webpage with a search bar and a submit button.
-        Frame 2: User has entered "Hello" in the search bar.
-        Frame 3: The submit button is clicked.
-        Frame 4: The webpage displays a search results page with a list of links.
-        ####
-        
-        ####
-        Commentary:
-        The user is performing a web search.
-        They start on a search page, enter their query, submit the search, and then view the results.
-        This grid captures the entire search process from start to finish.
-        
-        ####
-        Now, analyze the following 2x2 grid:
-        """
+        return self.PROMPT_TEMPLATE.format(grid_index=grid_index)
 
     def _process_output(self, raw_output):
         """
@@ -229,42 +773,57 @@ class DocsGenerator:
             return parts[1].strip()
         return raw_output.strip()
 
-    def generate_documentation_batch(self, image_paths, grid_indices, batch_size=4):
+    def generate_documentation_batch(self, image_paths, grid_indices, batch_size=4, concurrency=8):
         """
         Generate documentation for a batch of images.
 
         Args:
-            image_paths (list): List of paths to image files.
+            image_paths (list): List of paths to image files. JPEG bytes or PIL images are
+                accepted as well.
             grid_indices (list): List of grid indices corresponding to the images.
             batch_size (int): Number of images to process in parallel (only for HuggingFace model).
+            concurrency (int): Maximum number of concurrent API requests (only for OpenAI).
 
         Returns:
             list: Generated documentation for each image.
         """
         if self.model_type == 'huggingface':
-            results = []
-            for i in range(0, len(image_paths), batch_size):
-                batch_paths = image_paths[i:i+batch_size]
-                batch_indices = grid_indices[i:i+batch_size]
-                
-                images = [Image.open(path) for path in batch_paths]
-                prompts = [self._create_prompt(idx) for idx in batch_indices]
-                
-                inputs = self.processor(images=images, text=prompts, return_tensors="pt", padding=True).to(self.model.device)
-                
-                with torch.no_grad():
-                    outputs = self.model.generate(**inputs, max_new_tokens=2000)
-                
-                batch_results = self.processor.batch_decode(outputs, skip_special_tokens=True)
-                results.extend(batch_results)
-            
+            # Sort longest-first so each batch groups prompts of similar length and padding is minimal
+            prompt_lengths = [len(self._prompt_input_ids(idx)) for idx in grid_indices]
+            order = sorted(range(len(grid_indices)), key=lambda k: prompt_lengths[k], reverse=True)
+
+            batches = [order[i:i+batch_size] for i in range(0, len(order), batch_size)]
+
+            def prepare_batch(batch_order):
+                # Decode in parallel; libjpeg-turbo releases the GIL while decoding
+                image_features = list(decode_executor.map(lambda k: self._image_features(image_paths[k]), batch_order))
+                return self._to_device(self._build_inputs(image_features, [grid_indices[k] for k in batch_order]))
+
+            results = [None] * len(grid_indices)
+            with ThreadPoolExecutor(max_workers=8) as decode_executor, \
+                    ThreadPoolExecutor(max_workers=1) as prefetch_executor:
+                # Double-buffer: prepare batch N+1 on the CPU while the GPU generates batch N
+                next_inputs = prefetch_executor.submit(prepare_batch, batches[0]) if batches else None
+                for n, batch_order in enumerate(batches):
+                    inputs = next_inputs.result()
+                    if n + 1 < len(batches):
+                        next_inputs = prefetch_executor.submit(prepare_batch, batches[n + 1])
+
+                    outputs = self._generate(
+                        inputs,
+                        use_cache=True,
+                        do_sample=False,
+                        num_beams=1,
+                        pad_token_id=self.processor.tokenizer.pad_token_id,
+                    )
+
+                    batch_results = self.processor.batch_decode(outputs, skip_special_tokens=True)
+                    for k, documentation in zip(batch_order, batch_results):
+                        results[k] = self._process_output(documentation)
+
             return results
         else:  # OpenAI
-            results = []
-            for image_path, grid_index in zip(image_paths, grid_indices):
-                documentation = self.generate_documentation(image_path, grid_index)
-                results.append(documentation)
-            return results
+            return asyncio.run(self._generate_openai_batch(image_paths, grid_indices, concurrency))
 
     def generate_final_summary(self, all_descriptions):
         """
@@ -276,16 +835,30 @@ class DocsGenerator:
         Returns:
             str: A coherent summary of the entire process.
         """
+        return "".join(self.generate_final_summary_stream(all_descriptions))
+
+    def generate_final_summary_stream(self, all_descriptions):
+        """
+        Generate a final summary based on all grid descriptions, yielding the text in chunks as it
+        is generated.
+
+        Args:
+            all_descriptions (list): List of strings containing descriptions for each grid.
+
+        Yields:
+            str: Successive chunks of the summary.
+        """
         logger.info("Generating final summary")
         prompt = self._create_final_summary_prompt(all_descriptions)
 
         if self.model_type == 'huggingface':
             summary = self._generate_huggingface_summary(prompt)
+            if summary:
+                yield summary
         else:  # OpenAI
-            summary = self._generate_openai_summary(prompt)
+            yield from self._generate_openai_summary(prompt)
 
         logger.info("Final summary generated successfully")
-        return summary
 
     def _create_final_summary_prompt(self, all_descriptions):
         """
@@ -312,7 +885,7 @@ class DocsGenerator:
         """
 
     def _generate_openai_summary(self, prompt):
-        """Generate final summary using the OpenAI API."""
+        """Generate final summary using the OpenAI API, yielding text chunks as they arrive."""
         response = self.client.chat.completions.create(
             model="gpt-4o",  # You might want to use a more powerful model for this task
             messages=[
@@ -321,9 +894,10 @@ class DocsGenerator:
                     "content": prompt
                 }
             ],
-            max_tokens=1000
+            max_tokens=1000,
+            stream=True
         )
-        return response.choices[0].message.content
+        yield from self._iter_openai_stream(response)
 
     def _generate_huggingface_summary(self, prompt):
         """Generate final summary using the HuggingFace model."""
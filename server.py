@@ -6,37 +6,198 @@ for screen recordings. It interfaces with the VideoProcessor and DocsGenerator c
 process uploaded videos and generate documentation based on the processed frames.
 """
 
-from flask import Flask, render_template, send_from_directory, request, jsonify
+from flask import Flask, Response, render_template, send_from_directory, request, jsonify, stream_with_context
+from flask.json.provider import JSONProvider
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
+from pathlib import Path
 import logging
+import queue
+import threading
+import uuid
 from video_processor import VideoProcessor
 from docs_generator import DocsGenerator
-import base64
-import cv2
+import orjson
+from turbojpeg import TurboJPEG
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Get the current directory
-current_dir = os.path.dirname(os.path.abspath(__file__))
+current_dir = Path(__file__).resolve().parent
 
-# Create a temporary upload folder
-UPLOAD_FOLDER = os.path.join(current_dir, 'temp_uploads')
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Create a temporary upload folder, used for videos that can't be decoded from memory
+UPLOAD_FOLDER = current_dir / 'temp_uploads'
+UPLOAD_FOLDER.mkdir(exist_ok=True)
+
+# Grid images are kept in memory; set SAVE_GRIDS=1 to also write them here for debugging
+SAVE_GRIDS = os.getenv('SAVE_GRIDS') == '1'
+GRID_FOLDER = current_dir / 'processed_frames'
+if SAVE_GRIDS:
+    GRID_FOLDER.mkdir(exist_ok=True)
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson, which serializes responses considerably faster."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 # Initialize Flask app
 app = Flask(__name__, static_folder=current_dir, template_folder=current_dir)
+app.json = ORJSONProvider(app)
+
+# libjpeg-turbo encoder, several times faster than cv2.imencode
+jpeg = TurboJPEG()
 
 # Configure the upload folder
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Get the directory of the current file (server.py)
-root_dir = os.path.dirname(os.path.abspath(__file__))
-docs_generator = DocsGenerator(model_type='openai')
+# JPEG data of the grids of the most recently processed video
 processed_grids = []
 
+# Grids and video info of recently processed videos, keyed by (SHA-256 of the video, frames per
+# second). SHA-256 because browsers can compute it with crypto.subtle before uploading.
+MAX_CACHED_VIDEOS = 8
+video_cache = OrderedDict()
+video_cache_lock = threading.Lock()
+
+# Created on first use, so the model is loaded only once a documentation job needs it. This also
+# keeps CUDA uninitialized at import time, which gunicorn --preload requires: the app is imported
+# before the worker is forked, and a CUDA context doesn't survive a fork.
+_docs_generator = None
+_docs_generator_lock = threading.Lock()
+
+def get_docs_generator():
+    """Return the shared DocsGenerator, creating it on first use."""
+    global _docs_generator
+    if _docs_generator is None:
+        with _docs_generator_lock:
+            # Checked again under the lock so concurrent first calls don't load the model twice
+            if _docs_generator is None:
+                _docs_generator = DocsGenerator(model_type='openai')
+    return _docs_generator
+
+# Documentation jobs, keyed by job id. Generation runs on a background worker so long requests
+# don't tie up a request thread; clients poll /status/<job_id> for the result or follow the
+# summary as it is written through /stream/<job_id>.
+MAX_FINISHED_JOBS = 100
+jobs = {}
+job_queue = queue.Queue()
+worker_lock = threading.Lock()
+worker_thread = None
+# Notified whenever a job changes status or receives a new summary chunk
+job_updated = threading.Condition()
+
+def update_job(job_id, chunk=None, **fields):
+    """
+    Update a job and wake up the clients streaming it.
+
+    Args:
+        job_id (str): The id of the job.
+        chunk (str): A new chunk of the summary to append, if any.
+        **fields: Job fields to set, e.g. status or documentation.
+    """
+    with job_updated:
+        job = jobs[job_id]
+        if chunk is not None:
+            job['chunks'].append(chunk)
+        job.update(fields)
+        if job['status'] in ('done', 'error'):
+            # Finished jobs are kept for /status; their grids aren't needed anymore
+            job['grids'] = None
+        job_updated.notify_all()
+
+def submit_job(grids, grid_indices=None, summarize=True):
+    """
+    Queue a documentation job for the given grid images.
+
+    Args:
+        grids (list): JPEG data of the grid images, in order.
+        grid_indices (list): 1-based position of each grid in the video. Defaults to 1..n.
+        summarize (bool): Write a final summary of the grid descriptions. Otherwise the job
+            finishes with just the per-grid descriptions.
+
+    Returns:
+        str: The id of the new job.
+    """
+    global worker_thread
+    with worker_lock:
+        # Forget the oldest finished jobs so the job table doesn't grow without bound
+        finished = [job_id for job_id, job in jobs.items() if job['status'] in ('done', 'error')]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del jobs[job_id]
+
+        job_id = uuid.uuid4().hex
+        jobs[job_id] = {
+            'status': 'queued',
+            'grids': grids,
+            'grid_indices': grid_indices or list(range(1, len(grids) + 1)),
+            'summarize': summarize,
+            'chunks': [],
+            'descriptions': None,
+            'documentation': None,
+            'error': None,
+        }
+
+        # Started lazily, so the thread is created in the serving process rather than a preloading parent
+        if worker_thread is None or not worker_thread.is_alive():
+            worker_thread = threading.Thread(target=process_jobs, daemon=True)
+            worker_thread.start()
+
+    job_queue.put(job_id)
+    return job_id
+
+def process_jobs():
+    """
+    Worker loop: take every job waiting in the queue and describe all of their grids with a
+    single generate_documentation_batch call, then stream each job's final summary into the job
+    if it asked for one.
+    """
+    while True:
+        job_ids = [job_queue.get()]
+        while True:
+            try:
+                job_ids.append(job_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        for job_id in job_ids:
+            update_job(job_id, status='running')
+
+        try:
+            docs_generator = get_docs_generator()
+            grids, grid_indices, owners = [], [], []
+            for job_id in job_ids:
+                job_grids = jobs[job_id]['grids']
+                grids.extend(job_grids)
+                grid_indices.extend(jobs[job_id]['grid_indices'])
+                owners.extend([job_id] * len(job_grids))
+            descriptions = docs_generator.generate_documentation_batch(grids, grid_indices)
+        except Exception as e:
+            logger.exception("An error occurred while generating documentation")
+            for job_id in job_ids:
+                update_job(job_id, status='error', error=str(e))
+            continue
+
+        for job_id in job_ids:
+            try:
+                job_descriptions = [description for description, owner in zip(descriptions, owners) if owner == job_id]
+                if not jobs[job_id]['summarize']:
+                    update_job(job_id, status='done', descriptions=job_descriptions)
+                    continue
+                for chunk in docs_generator.generate_final_summary_stream(job_descriptions):
+                    update_job(job_id, chunk=chunk)
+                update_job(job_id, status='done', documentation=''.join(jobs[job_id]['chunks']))
+            except Exception as e:
+                logger.exception("An error occurred while generating the final summary")
+                update_job(job_id, status='error', error=str(e))
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -45,50 +206,144 @@ def index():
 def serve_js():
     return send_from_directory(current_dir, 'app.js')
 
+@app.route('/grid/<int:grid_number>.jpg')
+def serve_grid(grid_number):
+    if not 1 <= grid_number <= len(processed_grids):
+        return jsonify({'error': 'Grid not found'}), 404
+    # With an ETag, browsers revalidate instead of re-downloading
+    response = Response(processed_grids[grid_number - 1], mimetype='image/jpeg')
+    response.add_etag()
+    return response.make_conditional(request)
+
+def list_processed_frames():
+    """Return the number and URL of each grid of the most recently processed video, in order."""
+    return [{'frame_number': i + 1, 'url': f'/grid/{i + 1}.jpg'} for i in range(len(processed_grids))]
+
+@app.route('/processed_frames')
+def get_processed_frames():
+    return jsonify(list_processed_frames())
+
+class HashingReader:
+    """Binary stream wrapper that computes the SHA-256 of everything read through it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.hasher = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.hasher.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+def process_upload(video, frames_per_second):
+    """
+    Turn a video into JPEG-encoded grid images.
+
+    Args:
+        video (bytes or file object): The video's contents, or a stream to read them from.
+        frames_per_second (int): Frames per second to extract from the video.
+
+    Returns:
+        tuple: (grids, video_info), with the JPEG data of each grid.
+    """
+    video_processor = VideoProcessor(video, app.config['UPLOAD_FOLDER'], frames_per_second)
+    grid_images, video_info = video_processor.process_video()
+
+    def encode_grid(i, grid_image):
+        grid_data = jpeg.encode(grid_image, quality=85)
+        if SAVE_GRIDS:
+            # Zero-padded so the files sort in grid order
+            (GRID_FOLDER / f'grid_{i + 1:06d}.jpg').write_bytes(grid_data)
+        return grid_data
+
+    # Encode the grids in memory; the client fetches them through /grid/<n>.jpg. libjpeg-turbo
+    # releases the GIL, so the grids are encoded in parallel.
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        grids = list(executor.map(encode_grid, range(len(grid_images)), grid_images))
+    return grids, video_info
+
 @app.route('/process_video', methods=['POST'])
 def process_video():
+    """
+    Process an uploaded video into grid images. The video is either sent as the raw request body
+    (Content-Type video/*, frames_per_second in the query string), which is streamed to ffmpeg as
+    it arrives, or as the 'video' field of a multipart form. Raw uploads may carry the video's
+    SHA-256 in an X-Content-SHA256 header, so a video processed before is served from the cache.
+    """
     global processed_grids
     try:
         logger.info("Received /process_video POST request")
-        video = request.files.get('video')
-        frames_per_second = int(request.form.get('frames_per_second', 4))
-        
-        if not video:
-            return jsonify({"error": "No video file provided"}), 400
-        
-        logger.info(f"Processing video with {frames_per_second} frames per second.")
-        logger.info(f"Received file: name={video.filename}, content_type={video.content_type}, size={video.content_length}")
-        
-        # Save the uploaded video temporarily
-        video_path = os.path.join(app.config['UPLOAD_FOLDER'], 'temp_video.mp4')
-        video.save(video_path)
-        logger.info(f"Video saved to {video_path}") 
-        
-        # Log file information
-        file_size = os.path.getsize(video_path)
-        logger.info(f"Saved file size: {file_size} bytes")
-        
-        # Process the video
-        video_processor = VideoProcessor(video_path, app.config['UPLOAD_FOLDER'], frames_per_second)
-        grid_images, video_info = video_processor.process_video()
-        
-        if not grid_images:
+
+        if request.mimetype.startswith('video/'):
+            frames_per_second = int(request.args.get('frames_per_second', 4))
+            logger.info(f"Processing video with {frames_per_second} frames per second.")
+            logger.info(f"Streaming upload: content_type={request.mimetype}, size={request.content_length}")
+
+            # The hash sent by the client is only used for the lookup; what gets cached is keyed on
+            # the hash of the body as actually received
+            cached = None
+            content_hash = request.headers.get('X-Content-SHA256', '').lower()
+            if content_hash:
+                with video_cache_lock:
+                    cached = video_cache.get((content_hash, frames_per_second))
+                    if cached is not None:
+                        video_cache.move_to_end((content_hash, frames_per_second))
+
+            if cached is not None:
+                logger.info("Video was processed before; reusing its grids")
+                grids, video_info = cached
+                # Read the rest of the body so the connection can be reused
+                while request.stream.read(VideoProcessor.CHUNK_BYTES):
+                    pass
+            else:
+                upload = HashingReader(request.stream)
+                grids, video_info = process_upload(upload, frames_per_second)
+                while upload.read(VideoProcessor.CHUNK_BYTES):
+                    pass
+                cache_key = (upload.hexdigest(), frames_per_second)
+                if content_hash and content_hash != cache_key[0]:
+                    logger.warning("X-Content-SHA256 doesn't match the uploaded video")
+        else:
+            video = request.files.get('video')
+            frames_per_second = int(request.form.get('frames_per_second', 4))
+            
+            if not video:
+                return jsonify({"error": "No video file provided"}), 400
+            
+            logger.info(f"Processing video with {frames_per_second} frames per second.")
+            logger.info(f"Received file: name={video.filename}, content_type={video.content_type}, size={video.content_length}")
+            
+            # Keep the upload in memory; VideoProcessor hands it to ffmpeg through a pipe
+            video_data = video.read()
+            logger.info(f"Read {len(video_data)} bytes of video")
+            
+            # Identical uploads (retries, re-runs during development) reuse the grids they produced
+            cache_key = (hashlib.sha256(video_data).hexdigest(), frames_per_second)
+            with video_cache_lock:
+                cached = video_cache.get(cache_key)
+                if cached is not None:
+                    video_cache.move_to_end(cache_key)
+
+            if cached is not None:
+                logger.info("Video was processed before; reusing its grids")
+                grids, video_info = cached
+            else:
+                grids, video_info = process_upload(video_data, frames_per_second)
+
+        if not grids:
             return jsonify({"error": "No frames could be extracted from the video"}), 400
 
-        # Convert grid images to base64 for sending to client
-        processed_frames = []
-        for i, grid_image in enumerate(grid_images):
-            _, buffer = cv2.imencode('.jpg', grid_image)
-            jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-            processed_frames.append({
-                'frame_number': i + 1,
-                'image': jpg_as_text
-            })
-        
-        processed_grids = processed_frames
-        
-        # Clean up temporary files
-        os.remove(video_path)
+        if cached is None:
+            with video_cache_lock:
+                video_cache[cache_key] = (grids, video_info)
+                while len(video_cache) > MAX_CACHED_VIDEOS:
+                    video_cache.popitem(last=False)
+
+        processed_grids = grids
+        processed_frames = list_processed_frames()
         
         logger.info(f"Processed {len(processed_frames)} grids. Video info: {video_info}")
         return jsonify({"frames": processed_frames, "video_info": video_info})
@@ -99,28 +354,116 @@ def process_video():
 
 @app.route('/generate_documentation', methods=['POST'])
 def generate_documentation():
-    try:
-        global processed_grids
-        
-        if not processed_grids:
-            logger.warning("No processed video frames available.")
-            return jsonify({'error': 'No processed video frames available. Please process a video first.'}), 400
-        
-        docs_generator = DocsGenerator(model_type='openai')
-        
-        all_descriptions = []
-        for i, grid_data in enumerate(processed_grids):
-            image_bytes = base64.b64decode(grid_data['image'])
-            description = docs_generator.generate_documentation(image_bytes, i+1)
-            all_descriptions.append(description)
-        
-        final_summary = docs_generator.generate_final_summary(all_descriptions)
-        
-        return jsonify({'documentation': final_summary})
-    
-    except Exception as e:
-        logger.exception("An error occurred while generating documentation")
-        return jsonify({'error': str(e)}), 500
+    global processed_grids
+
+    if not processed_grids:
+        logger.warning("No processed video frames available.")
+        return jsonify({'error': 'No processed video frames available. Please process a video first.'}), 400
+
+    job_id = submit_job(list(processed_grids))
+    logger.info(f"Queued documentation job {job_id} for {len(processed_grids)} grids")
+    return jsonify({'job_id': job_id, 'status_url': f'/status/{job_id}', 'stream_url': f'/stream/{job_id}'}), 202
+
+@app.route('/stream_grid/<int:grid_number>')
+def stream_grid(grid_number):
+    """
+    Describe a single grid of the processed video, streaming the text as server-sent events while
+    it is generated. Events are framed like /stream/<job_id>: `message` events carry JSON-encoded
+    chunks, and a `done` event (full text) or `failed` event (error) ends the stream. Events carry
+    no ids: a reconnect starts a new generation, so clients close the stream on errors instead.
+    """
+    if not 1 <= grid_number <= len(processed_grids):
+        return jsonify({'error': 'Grid not found'}), 404
+    grid = processed_grids[grid_number - 1]
+
+    def events():
+        chunks = []
+        try:
+            for chunk in get_docs_generator().generate_documentation_stream(grid, grid_number):
+                chunks.append(chunk)
+                yield f"data: {orjson.dumps(chunk).decode('utf-8')}\n\n"
+        except Exception as e:
+            logger.exception(f"An error occurred while describing grid {grid_number}")
+            yield f"event: failed\ndata: {orjson.dumps(str(e)).decode('utf-8')}\n\n"
+            return
+        yield f"event: done\ndata: {orjson.dumps(''.join(chunks)).decode('utf-8')}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/generate_docs_batch', methods=['POST'])
+def generate_docs_batch():
+    """
+    Describe a selection of grids of the processed video in one batched job, without a final
+    summary. Expects a JSON body {"grid_indices": [1, 2, ...]} with 1-based grid numbers.
+    """
+    grid_indices = (request.get_json(silent=True) or {}).get('grid_indices')
+    if not isinstance(grid_indices, list) or not grid_indices:
+        return jsonify({'error': 'grid_indices must be a non-empty list of grid numbers'}), 400
+
+    grids = list(processed_grids)
+    # type() rather than isinstance(): JSON true/false arrive as bool, a subclass of int
+    if not all(type(index) is int for index in grid_indices):
+        return jsonify({'error': 'grid_indices must be a non-empty list of grid numbers'}), 400
+    if not all(1 <= index <= len(grids) for index in grid_indices):
+        return jsonify({'error': f'Grid numbers must be between 1 and {len(grids)}'}), 400
+
+    job_id = submit_job([grids[index - 1] for index in grid_indices], grid_indices, summarize=False)
+    logger.info(f"Queued description job {job_id} for grids {grid_indices}")
+    return jsonify({'job_id': job_id, 'status_url': f'/status/{job_id}'}), 202
+
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({
+        'status': job['status'],
+        'documentation': job['documentation'],
+        'descriptions': job['descriptions'],
+        'error': job['error'],
+    })
+
+@app.route('/stream/<job_id>')
+def stream_job(job_id):
+    """
+    Stream a job's summary as server-sent events. Each `message` event carries a JSON-encoded text
+    chunk, with the number of chunks sent so far as its id; the stream ends with a `done` event
+    holding the full documentation, or a `failed` event holding the error. A reconnecting client
+    sends the last id it received in Last-Event-ID and resumes after that chunk.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    start = int(last_event_id) if last_event_id.isdigit() else 0
+
+    def events():
+        sent = start
+        while True:
+            with job_updated:
+                job_updated.wait_for(
+                    lambda: len(job['chunks']) > sent or job['status'] in ('done', 'error'), timeout=15
+                )
+                chunks = job['chunks'][sent:]
+                status = job['status']
+
+            for chunk in chunks:
+                sent += 1
+                yield f"id: {sent}\ndata: {orjson.dumps(chunk).decode('utf-8')}\n\n"
+            if status == 'done':
+                yield f"event: done\ndata: {orjson.dumps(job['documentation']).decode('utf-8')}\n\n"
+                return
+            if status == 'error':
+                yield f"event: failed\ndata: {orjson.dumps(job['error']).decode('utf-8')}\n\n"
+                return
+            if not chunks:
+                # Comment line; keeps proxies from closing the connection while grids are described
+                yield ": keep-alive\n\n"
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    # The reloader runs the app in a second process, loading (and compiling) the model twice, so
+    # it stays off even in debug mode. Opt in to debug mode with FLASK_DEBUG=1 during development.
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', use_reloader=False, port=5001)
\ No newline at end of file
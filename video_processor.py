@@ -12,9 +12,8 @@ The main features of this module include:
 4. Saving grid images to disk
 
 Usage:
-    processor = VideoProcessor(video_path, output_dir)
-    processor.set_frames_per_second(4)
-    grid_paths, video_info = processor.process_video()
+    processor = VideoProcessor(video_path, output_dir, frames_per_second=4)
+    grid_images, video_info = processor.process_video()
 """
 
 import cv2
@@ -23,27 +22,48 @@ import logging
 import numpy as np
 from PIL import Image
 import subprocess
+import tempfile
+import threading
+import contextlib
+import itertools
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from math import ceil
 
 logger = logging.getLogger(__name__)
 
 class VideoProcessor:
-    def __init__(self, video_path, output_dir, frames_per_second, grid_size=(2, 2), max_grid_width=800):
+    # Bytes of a streamed video buffered up front for ffprobe, and the size of later reads
+    PROBE_BYTES = 8 * 1024 * 1024
+    CHUNK_BYTES = 1024 * 1024
+
+    def __init__(self, video_path, output_dir, frames_per_second, grid_size=(2, 2), max_grid_width=800,
+                 tile_with_ffmpeg=True, hwaccel='auto'):
         """
         Initialize the VideoProcessor.
 
         Args:
-            video_path (str): Path to the input video file.
+            video_path (str, bytes or file object): Path to the input video file, the video's
+                contents, or a binary stream to read the video from (e.g. an upload as it arrives).
             output_dir (str): Directory to save processed frames and grids.
             frames_per_second (int): Frames per second to extract from the video.
             grid_size (tuple): Size of the grid for frame arrangement (default: (2, 2)).
             max_grid_width (int): Maximum width of each grid image in pixels (default: 800).
+                DocsGenerator fits grids to the local vision model's input size itself, so this
+                only needs to keep on-screen text readable.
+            tile_with_ffmpeg (bool): Let ffmpeg scale, pad and tile the frames into grids
+                (default: True). Otherwise frames are laid out into grids with OpenCV.
+            hwaccel (str): ffmpeg hardware decoding method, e.g. 'cuda' or 'videotoolbox'
+                (default: 'auto', which uses whatever is available and falls back to software
+                decoding). None decodes on the CPU.
         """
         self.video_path = video_path
         self.output_dir = output_dir
         self.frames_per_second = frames_per_second
         self.grid_size = grid_size
         self.max_grid_width = max_grid_width
+        self.tile_with_ffmpeg = tile_with_ffmpeg
+        self.hwaccel = hwaccel
 
     def set_frames_per_second(self, fps):
         """
@@ -54,40 +74,263 @@ class VideoProcessor:
         """
         self.frames_per_second = fps
  
-    def extract_frames(self):
-        frames_dir = os.path.join(self.output_dir, 'temp_frames')
-        os.makedirs(frames_dir, exist_ok=True)
-        
-        command = [
-            'ffmpeg',
-            '-i', self.video_path,
-            '-vf', f'fps={self.frames_per_second}',
-            '-q:v', '2',  # High quality
-            f'{frames_dir}/frame_%04d.jpg'
+    def extract_frames(self, source, width, height, data=None):
+        """
+        Decode frames at the configured rate, streamed from ffmpeg as raw BGR pixels.
+
+        Args:
+            source (str): ffmpeg input: a file path, or 'pipe:0' to read the video from stdin.
+            width (int): Frame width in pixels, as reported by _probe_frame_size.
+            height (int): Frame height in pixels.
+            data (iterable): Chunks of video data to write to ffmpeg's stdin when reading from
+                a pipe.
+
+        Yields:
+            numpy.ndarray: Successive frames of shape (height, width, 3).
+        """
+        return self._read_raw_video(f'fps={self.frames_per_second}', source, width, height, data)
+
+    def extract_grids(self, source, width, height, data=None):
+        """
+        Decode frames at the configured rate and have ffmpeg scale, letterbox and tile them into
+        grid images, streamed as raw BGR pixels. Unused cells of the last grid are black.
+
+        Args:
+            source (str): ffmpeg input: a file path, or 'pipe:0' to read the video from stdin.
+            width (int): Frame width in pixels, as reported by _probe_frame_size.
+            height (int): Frame height in pixels.
+            data (iterable): Chunks of video data to write to ffmpeg's stdin when reading from
+                a pipe.
+
+        Yields:
+            numpy.ndarray: Successive grid images.
+        """
+        rows, cols = self.grid_size
+        cell_width, cell_height = self._cell_size(width, height)
+        filters = ','.join([
+            f'fps={self.frames_per_second}',
+            # Fit frames into the cell, letterboxing any whose aspect ratio differs
+            f'scale={cell_width}:{cell_height}:force_original_aspect_ratio=decrease:flags=area',
+            'format=bgr24',
+            f'pad={cell_width}:{cell_height}:(ow-iw)/2:(oh-ih)/2',
+            f'tile={cols}x{rows}',
+        ])
+        return self._read_raw_video(filters, source, cols * cell_width, rows * cell_height, data)
+
+    def _read_raw_video(self, filters, source, width, height, data=None):
+        """
+        Run ffmpeg with a filter graph and stream its output as raw BGR frames.
+
+        Args:
+            filters (str): ffmpeg video filter graph.
+            source (str): ffmpeg input: a file path, or 'pipe:0' to read the video from stdin.
+            width (int): Width of the filter graph's output in pixels.
+            height (int): Height of the filter graph's output in pixels.
+            data (iterable): Chunks of video data to write to ffmpeg's stdin when reading from
+                a pipe.
+
+        Yields:
+            numpy.ndarray: Successive output frames of shape (height, width, 3).
+        """
+        frame_size = width * height * 3
+        command = ['ffmpeg', '-loglevel', 'error']
+        if self.hwaccel:
+            # Decoded frames are copied back to system memory for the filters
+            command += ['-hwaccel', self.hwaccel]
+        command += [
+            '-noautorotate',  # Keep frames at the probed width and height
+            '-i', source,
+            '-an', '-sn', '-dn',  # Only the video stream is needed; skip demuxing the rest
+            '-vf', filters,
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-'
         ]
-        
+
+        # ffmpeg's log goes to a file rather than a pipe: decode errors on a corrupt video can fill
+        # a pipe's buffer while stdout is being read, blocking ffmpeg and this reader with it
+        error_log = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE if data is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=error_log,
+            bufsize=frame_size * 8,
+        )
+
+        writer = None
+        # Errors raised while reading the input (e.g. the client aborting an upload)
+        input_errors = []
+        if data is not None:
+            # Feed stdin from a separate thread; writing it all up front would deadlock once
+            # ffmpeg blocks on a full stdout pipe
+            def write_input():
+                try:
+                    for chunk in data:
+                        process.stdin.write(chunk)
+                except BrokenPipeError:
+                    # ffmpeg exited early; the error surfaces through its exit status
+                    pass
+                except Exception as e:
+                    # Stop ffmpeg rather than let it decode a truncated video as if it were complete
+                    input_errors.append(e)
+                    process.kill()
+                finally:
+                    # Without EOF on stdin, ffmpeg (and the reader below) would wait forever
+                    try:
+                        process.stdin.close()
+                    except BrokenPipeError:
+                        pass
+
+            writer = threading.Thread(target=write_input, daemon=True)
+            writer.start()
+
         try:
-            subprocess.run(command, check=True, capture_output=True, text=True)
-            logger.info(f"Frames extracted successfully to {frames_dir}")
-            return frames_dir
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error extracting frames: {e.stderr}")
-            raise
+            while True:
+                buffer = process.stdout.read(frame_size)
+                if len(buffer) < frame_size:
+                    break
+                yield np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3)
+
+            if writer is not None:
+                writer.join()
+            if input_errors:
+                raise input_errors[0]
+            if process.wait() != 0:
+                error_log.seek(0)
+                stderr = error_log.read()
+                logger.error(f"Error extracting frames: {stderr.decode(errors='replace')}")
+                raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            if writer is not None:
+                writer.join()
+            process.stdout.close()
+            error_log.close()
+
+    def _probe_frame_size(self, source, data=None):
+        """
+        Read the width and height of the video stream with ffprobe.
+
+        Args:
+            source (str): ffprobe input: a file path, or 'pipe:0' to read the video from stdin.
+            data (bytes): Video data to write to ffprobe's stdin when reading from a pipe.
+
+        Returns:
+            tuple: (width, height) in pixels.
+        """
+        command = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height',
+            '-of', 'csv=p=0:s=x',
+            source
+        ]
+        result = subprocess.run(command, check=True, capture_output=True, input=data)
+        width, height = result.stdout.decode().split()[0].split('x')[:2]
+        return int(width), int(height)
+
+    @staticmethod
+    def _index_at_end(head):
+        """
+        Check whether an MP4/MOV file keeps its moov atom (the index) after its media data, by
+        walking the top-level atoms at the start of the file.
+
+        Args:
+            head (bytes): The start of the video file.
+
+        Returns:
+            bool: True if the file is an MP4/MOV whose moov atom doesn't come before mdat. Other
+                containers (e.g. WebM) return False.
+        """
+        # QuickTime files don't always start with ftyp
+        if head[4:8] not in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot'):
+            return False
+
+        offset = 0
+        while offset + 8 <= len(head):
+            size = int.from_bytes(head[offset:offset + 4], 'big')
+            atom_type = head[offset + 4:offset + 8]
+            if atom_type == b'moov':
+                return False
+            if atom_type == b'mdat':
+                return True
+            if size == 1:
+                # 64-bit size follows the type
+                if offset + 16 > len(head):
+                    break
+                size = int.from_bytes(head[offset + 8:offset + 16], 'big')
+            if size < 8:
+                # Size 0 means the atom runs to the end of the file
+                break
+            offset += size
+
+        # No moov within the head, so it can't be read from the start of the stream
+        return True
+
+    @contextlib.contextmanager
+    def _open_video(self):
+        """
+        Resolve the video into an ffmpeg input and probe its frame size.
+
+        In-memory videos and streams are read through a pipe; for a stream, only its first
+        PROBE_BYTES are buffered to probe it and the rest is copied to ffmpeg as it arrives.
+        Containers that keep their index at the end (e.g. MP4 with a trailing moov atom) can't be
+        read that way and are spilled to a temporary file instead.
+
+        Yields:
+            tuple: (source, width, height, data), where data is an iterable of chunks to feed
+                through stdin, or None when ffmpeg reads from a file.
+        """
+        if isinstance(self.video_path, str):
+            yield (self.video_path, *self._probe_frame_size(self.video_path), None)
+            return
+
+        if isinstance(self.video_path, bytes):
+            head, stream = self.video_path, None
+        else:
+            head, stream = self.video_path.read(self.PROBE_BYTES), self.video_path
+
+        # ffprobe can find a trailing moov atom by reading forward, but decoding then needs to
+        # seek back to the start of mdat, which a pipe can't do
+        if self._index_at_end(head):
+            logger.info("Video index is at the end of the file; using a temporary file")
+        else:
+            try:
+                width, height = self._probe_frame_size('pipe:0', head)
+            except (subprocess.CalledProcessError, ValueError, IndexError):
+                logger.info("Could not read the video through a pipe; using a temporary file")
+            else:
+                data = [head]
+                if stream is not None:
+                    data = itertools.chain(data, iter(lambda: stream.read(self.CHUNK_BYTES), b''))
+                yield 'pipe:0', width, height, data
+                return
+
+        with tempfile.NamedTemporaryFile(dir=self.output_dir, suffix='.video') as video_file:
+            video_file.write(head)
+            if stream is not None:
+                shutil.copyfileobj(stream, video_file, self.CHUNK_BYTES)
+            video_file.flush()
+            yield (video_file.name, *self._probe_frame_size(video_file.name), None)
 
     def process_video(self):
         """
-        Process the video: extract frames, create grids, and save them.
+        Process the video: extract frames and create grids.
 
         This method performs the following steps:
-        1. Extracts frames at the specified interval using FFmpeg
-        2. Reads the extracted frames using OpenCV
-        3. Creates grid images from the extracted frames
-        4. Calculates video information using FFprobe for accurate duration
-        5. Saves the grid images to disk
+        1. Probes the frame size of the video using FFprobe
+        2. Streams frames at the specified interval from FFmpeg, already tiled into grid images
+           when tile_with_ffmpeg is set
+        3. Otherwise assembles the frames into grid images as they arrive, so only one grid's
+           worth of frames is held in memory
 
         Returns:
-            tuple: (grid_paths, video_info)
-                grid_paths (list): List of paths to saved grid images.
+            tuple: (grid_images, video_info)
+                grid_images (list): Grid images as numpy arrays.
                 video_info (dict): Dictionary containing video information:
                     - total_frames: Total number of frames in the original video
                     - original_fps: Original frames per second of the video
@@ -97,41 +340,41 @@ class VideoProcessor:
                     - processed_fps: Frames per second used for processing
         """
         try:
-            frames_dir = self.extract_frames()
-            frame_files = sorted([f for f in os.listdir(frames_dir) if f.endswith('.jpg')])
-            
-            extracted_frames = []
-            for frame_file in frame_files:
-                frame_path = os.path.join(frames_dir, frame_file)
-                frame = cv2.imread(frame_path)
-                if frame is not None:
-                    extracted_frames.append(frame)
-                else:
-                    logger.warning(f"Failed to read frame: {frame_path}")
+            extracted_frames = 0
 
-            logger.info(f"Extracted {len(extracted_frames)} frames")
+            def count_frames(frames):
+                nonlocal extracted_frames
+                for frame in frames:
+                    extracted_frames += 1
+                    yield frame
 
-            grid_images = self.create_grid_images(extracted_frames)
+            with self._open_video() as (source, width, height, data):
+                if self.tile_with_ffmpeg:
+                    grid_images = list(self.extract_grids(source, width, height, data))
+                    if grid_images:
+                        extracted_frames = (len(grid_images) - 1) * self.grid_size[0] * self.grid_size[1]
+                        extracted_frames += self._count_filled_cells(grid_images[-1], width, height)
+                else:
+                    frames = count_frames(self.extract_frames(source, width, height, data))
+                    # Every frame from the pipe has the probed size, so no aspect-ratio padding is needed
+                    grid_images = list(self._assemble_grids(frames, width, height))
+
+            logger.info(f"Extracted {extracted_frames} frames")
 
             # Calculate duration based on extracted frames and FPS
-            duration = len(extracted_frames) / self.frames_per_second
+            duration = extracted_frames / self.frames_per_second
 
             video_info = {
-                'total_frames': len(extracted_frames),
+                'total_frames': extracted_frames,
                 'original_fps': self.frames_per_second,
                 'duration': duration,
-                'extracted_frames': len(extracted_frames),
+                'extracted_frames': extracted_frames,
                 'grids_created': len(grid_images),
                 'processed_fps': self.frames_per_second
             }
 
             logger.info(f"Video processing complete. Created {len(grid_images)} grid images.")
             
-            # Clean up temporary files
-            for frame_file in frame_files:
-                os.remove(os.path.join(frames_dir, frame_file))
-            os.rmdir(frames_dir)
-            
             return grid_images, video_info
 
         except Exception as e:
@@ -143,61 +386,140 @@ class VideoProcessor:
         Create grid images from extracted frames.
 
         This method performs the following steps:
-        1. Calculates the number of grids needed based on the number of frames
-        2. Resizes frames to fit within the specified maximum grid width
-        3. Creates grid images by arranging resized frames
-        4. Saves each grid image to disk
+        1. Finds the most common aspect ratio and, among frames that have it, the most common size
+        2. Lays the frames out into grids with _assemble_grids, padding each frame to that aspect
+           ratio as it is resized into its cell
 
         Args:
             frames (list): List of extracted frames as numpy arrays.
 
         Returns:
-            list: Paths to saved grid images.
+            list: Grid images as numpy arrays.
         """
-        grid_images = []
-        frames_per_grid = self.grid_size[0] * self.grid_size[1]
+        if not frames:
+            return []
         
         # Find the target aspect ratio (use the most common aspect ratio)
-        aspect_ratios = [frame.shape[1] / frame.shape[0] for frame in frames]
-        target_aspect_ratio = max(set(aspect_ratios), key=aspect_ratios.count)
-        
-        # Pad all frames to the target aspect ratio
-        padded_frames = [self.pad_image(frame, target_aspect_ratio) for frame in frames]
-        
-        # Find the most common frame size after padding
-        heights, widths = zip(*[frame.shape[:2] for frame in padded_frames])
-        common_height = max(set(heights), key=heights.count)
-        common_width = max(set(widths), key=widths.count)
-        
-        # Resize all frames to the common size
-        resized_frames = [cv2.resize(frame, (common_width, common_height)) for frame in padded_frames]
-        
-        for i in range(0, len(resized_frames), frames_per_grid):
-            grid_frames = resized_frames[i:i+frames_per_grid]
-            if len(grid_frames) < frames_per_grid:
-                blank_frame = np.zeros((common_height, common_width, 3), dtype=np.uint8)
-                grid_frames.extend([blank_frame] * (frames_per_grid - len(grid_frames)))
-            
-            rows = []
-            for j in range(0, frames_per_grid, self.grid_size[1]):
-                row = np.hstack(grid_frames[j:j+self.grid_size[1]])
-                rows.append(row)
-            grid = np.vstack(rows)
-            
-            if grid.shape[1] > self.max_grid_width:
-                scale_factor = self.max_grid_width / grid.shape[1]
-                new_height = int(grid.shape[0] * scale_factor)
-                grid = cv2.resize(grid, (self.max_grid_width, new_height))
-            
-            grid_images.append(grid)
+        shapes = np.array([frame.shape[:2] for frame in frames])
+        ratios = shapes[:, 1] / shapes[:, 0]
+        aspect_ratios, counts = np.unique(ratios, return_counts=True)
+        target_aspect_ratio = float(aspect_ratios[counts.argmax()])
+
+        # Frames with the target aspect ratio are left as they are by padding, so the most common
+        # size after padding is the most common size among them
+        sizes, counts = np.unique(shapes[ratios == target_aspect_ratio], axis=0, return_counts=True)
+        common_height, common_width = (int(size) for size in sizes[counts.argmax()])
+
+        # Each frame is padded and resized into its cell in one step, without intermediate lists
+        return list(self._assemble_grids(frames, common_width, common_height, pad_to=target_aspect_ratio))
 
-        return grid_images
+    def _assemble_grids(self, frames, frame_width, frame_height, pad_to=None):
+        """
+        Lay out frames into grid images, consuming them one at a time.
+
+        Args:
+            frames (iterable): Frames as numpy arrays, all with the aspect ratio of
+                frame_width x frame_height unless pad_to is given.
+            frame_width (int): Common width of the frames in pixels.
+            frame_height (int): Common height of the frames in pixels.
+            pad_to (float): Aspect ratio to pad each frame to before resizing it into its cell.
+
+        Yields:
+            numpy.ndarray: Each completed grid image.
+        """
+        rows, cols = self.grid_size
+        frames_per_grid = rows * cols
+        cell_width, cell_height = self._cell_size(frame_width, frame_height)
+
+        def fill_cell(frame, cell):
+            if pad_to is not None:
+                frame = self.pad_image(frame, pad_to)
+            if frame.shape[:2] == (cell_height, cell_width):
+                cell[:] = frame
+            else:
+                # Resize straight into the canvas; INTER_AREA avoids aliasing when shrinking
+                interpolation = cv2.INTER_AREA if frame.shape[1] > cell_width else cv2.INTER_LINEAR
+                cv2.resize(frame, (cell_width, cell_height), dst=cell, interpolation=interpolation)
+
+        # copyMakeBorder and resize release the GIL, so cells are filled in parallel while the next
+        # frames are read
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            grid = None
+            pending = []
+            for frame in frames:
+                if grid is None:
+                    grid = np.empty((rows * cell_height, cols * cell_width, 3), dtype=np.uint8)
+                y = (len(pending) // cols) * cell_height
+                x = (len(pending) % cols) * cell_width
+                pending.append(executor.submit(fill_cell, frame, grid[y:y+cell_height, x:x+cell_width]))
+
+                if len(pending) == frames_per_grid:
+                    for future in pending:
+                        future.result()
+                    yield grid
+                    grid = None
+                    pending = []
+
+            if grid is not None:
+                for future in pending:
+                    future.result()
+                # Blank cells at the end of the last grid
+                for j in range(len(pending), frames_per_grid):
+                    y = (j // cols) * cell_height
+                    x = (j % cols) * cell_width
+                    grid[y:y+cell_height, x:x+cell_width] = 0
+                yield grid
+
+    def _cell_size(self, frame_width, frame_height):
+        """
+        Compute the size of one grid cell, scaled down so the grid fits within max_grid_width.
+        Sizing the cells up front means grids are created at their final size rather than
+        rescaled afterwards.
+
+        Args:
+            frame_width (int): Common width of the frames in pixels.
+            frame_height (int): Common height of the frames in pixels.
+
+        Returns:
+            tuple: (cell_width, cell_height) in pixels.
+        """
+        cols = self.grid_size[1]
+        if cols * frame_width <= self.max_grid_width:
+            return frame_width, frame_height
+        cell_width = self.max_grid_width // cols
+        return cell_width, max(1, round(frame_height * cell_width / frame_width))
+
+    def _count_filled_cells(self, grid, frame_width, frame_height):
+        """
+        Count the cells of a grid from extract_grids that hold a frame; ffmpeg leaves the unused
+        cells of the last grid black. A frame that is entirely black is counted as unused.
+
+        Args:
+            grid (numpy.ndarray): A grid image.
+            frame_width (int): Width of the source frames in pixels.
+            frame_height (int): Height of the source frames in pixels.
+
+        Returns:
+            int: The number of cells before the trailing blank ones.
+        """
+        rows, cols = self.grid_size
+        cell_width, cell_height = self._cell_size(frame_width, frame_height)
+        filled = rows * cols
+        while filled > 1:
+            y = ((filled - 1) // cols) * cell_height
+            x = ((filled - 1) % cols) * cell_width
+            if grid[y:y+cell_height, x:x+cell_width].any():
+                break
+            filled -= 1
+        return filled
 
     def pad_image(self, image, target_aspect_ratio):
         height, width = image.shape[:2]
         current_aspect_ratio = width / height
         
-        if current_aspect_ratio > target_aspect_ratio:
+        if current_aspect_ratio == target_aspect_ratio:
+            return image
+        elif current_aspect_ratio > target_aspect_ratio:
             # Pad height
             new_height = int(width / target_aspect_ratio)
             pad_top = (new_height - height) // 2